@@ -5,6 +5,8 @@ import itertools
 import json
 import sys
 
+from collections import Counter
+
 
 def load_data(f):
     data = []
@@ -15,7 +17,6 @@ def load_data(f):
 
 def Deg(r):
     return r["Deg"]
-n
 
 def Values(path):
     parts = [x for x in path.split(".") if x]
@@ -95,7 +96,158 @@ def agg_ping_loss(samples):
         return (sent - recv)/recv*100
 
 
+CELL_METRICS = ["RSRP", "RSRQ", "SINR"]
+
+
+def serving_cells(r):
+    """Yield (cell, metrics) for each cell observed in a single record.
+
+    A cell is keyed on (RAT, PCID, EARFCN, band). Secondary carriers are taken
+    from the CA list; the primary carrier only when QENG did not report the
+    serving LTE cell, so it is not counted twice.
+    """
+    if r.get("SC LTE PCID") is not None:
+        yield (("LTE", r["SC LTE PCID"], r["SC LTE EARFCN"], r["SC LTE Band"]),
+               [r.get(f"SC LTE {m}") for m in CELL_METRICS])
+    if r.get("SC NSA PCID") is not None:
+        yield (("NR5G", r["SC NSA PCID"], r["SC NSA ARFCN"], r["SC NSA Band"]),
+               [r.get(f"SC NSA {m}") for m in CELL_METRICS])
+    for ca in r.get("CA") or []:
+        if ca["Type"] == "PCC" and r.get("SC LTE PCID") is not None:
+            continue
+        yield (("LTE", int(ca["PCID"]), ca["EARFCN"], ca["Band"]),
+               [ca.get(m) for m in CELL_METRICS])
+
+
+def cell_name(cell):
+    rat, pcid, earfcn, band = cell
+    return f"{rat} PCID {pcid} / EARFCN {earfcn} / B{band}"
+
+
+# Accumulate per (heading, cell) histograms of each metric in a single pass over the
+# data set. Metrics are integer dB/dBm readings so each histogram is bounded by the
+# metric's range regardless of how many samples are collected.
+def aggregate_cells(data):
+    acc = {}
+    for r in data:
+        for cell, values in serving_cells(r):
+            hists = acc.get((r["Deg"], cell))
+            if hists is None:
+                hists = acc[(r["Deg"], cell)] = [Counter() for _ in CELL_METRICS]
+            for hist, v in zip(hists, values):
+                if v is not None:
+                    hist[v] += 1
+    return acc
+
+
+def hist_p(factor):
+    def f(hist):
+        n = sum(hist.values())
+        if n < 1:
+            return None
+
+        idx = int(round(max(0, min(n - 1, n * factor - 1))))
+        for v in sorted(hist):
+            idx -= hist[v]
+            if idx < 0:
+                return v
+    return f
+
+
+def cell_breakdown(acc, agg):
+    cells = {}
+    for (deg, cell), hists in acc.items():
+        cells.setdefault(cell, {})[deg] = [agg(h) for h in hists]
+    return cells
+
+
+def cell_scatter_data(headings, metric):
+    i = CELL_METRICS.index(metric)
+    return json.dumps([{"x": deg, "y": headings[deg][i]} for deg in sorted(headings)])
+
+
+def best_heading(headings):
+    i = CELL_METRICS.index("RSRP")
+    candidates = [deg for deg in headings if headings[deg][i] is not None]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda deg: headings[deg][i])
+
+
+def cell_charts(cells):
+    out = []
+    for n, cell in enumerate(sorted(cells)):
+        headings = cells[cell]
+        out.append(f"""<div id="cell{n}" style="width: 2000px; height: 600px; margin: 0 auto"></div>
+<script>
+Highcharts.chart("cell{n}", {{
+    chart: {{
+        type: "scatter"
+    }},
+    title: {{ text: "{cell_name(cell)}" }},
+    yAxis: [{{
+        title: {{ text: "RSRP (dBm)"}},
+        max: -44,
+        min: -140
+    }},
+    {{
+        title: {{ text: "RSRQ (dBm)"}},
+        max: -3,
+        min: -20
+    }},
+    {{
+        title: {{ text: "SINR (db)"}},
+        max: 30,
+        min: -20
+    }}],
+    series: [{{
+        type: "scatter",
+        name: "RSRP",
+        yAxis: 0,
+        lineWidth: 2,
+        data: {cell_scatter_data(headings, "RSRP")}
+    }},
+    {{
+        type: "scatter",
+        name: "RSRQ",
+        yAxis: 1,
+        lineWidth: 2,
+        data: {cell_scatter_data(headings, "RSRQ")}
+    }},
+    {{
+        type: "scatter",
+        name: "SINR",
+        yAxis: 2,
+        lineWidth: 2,
+        data: {cell_scatter_data(headings, "SINR")}
+    }}
+    ]
+}});
+</script>
+""")
+    return "".join(out)
+
+
+def best_heading_table(cells):
+    rows = []
+    for cell in sorted(cells):
+        headings = cells[cell]
+        deg = best_heading(headings)
+        if deg is None:
+            continue
+        rsrp, rsrq, sinr = headings[deg]
+        rows.append(f"<tr><td>{cell_name(cell)}</td><td>{deg}</td><td>{rsrp}</td><td>{rsrq}</td><td>{sinr}</td></tr>")
+    rows = "\n".join(rows)
+    return f"""<table>
+<tr><th>Cell</th><th>Best Heading (P90 RSRP)</th><th>RSRP (dBm)</th><th>RSRQ (dBm)</th><th>SINR (db)</th></tr>
+{rows}
+</table>
+"""
+
+
 def write_html(f, data):
+    cells = cell_breakdown(aggregate_cells(data), hist_p(0.90))
+
     str = \
     f"""<!doctype html>
 <html>
@@ -206,6 +358,8 @@ Highcharts.chart("container", {{
     ]
 }});
 </script>
+{best_heading_table(cells)}
+{cell_charts(cells)}
 </body>
 
 </html>